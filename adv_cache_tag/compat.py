@@ -8,6 +8,12 @@ else:
     def get_cache(name):
         return caches[name]
 
+try:
+    # faster decompression if python-isal is installed (it produces/reads standard zlib data)
+    from isal.isal_zlib import decompress as zlib_decompress
+except ImportError:
+    from zlib import decompress as zlib_decompress
+
 try:
     from django.template import BLOCK_TAG_START
 except ImportError:
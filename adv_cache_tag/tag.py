@@ -12,7 +12,7 @@ from django.utils.encoding import smart_str, force_bytes
 # from django.utils.http import urlquote
 from urllib.parse import quote as urlquote
 
-from .compat import get_cache, get_template_libraries, template
+from .compat import get_cache, get_template_libraries, template, zlib_decompress
 
 
 try:
@@ -413,7 +413,7 @@ class CacheTag(object, metaclass=CacheTagMetaClass):
         Decode (decompress...) the content got from the cache, to the final
         html
         """
-        self.content = pickle.loads(zlib.decompress(self.content))
+        self.content = pickle.loads(zlib_decompress(self.content))
 
     def encode_content(self):
         """
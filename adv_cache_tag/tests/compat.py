@@ -1,13 +1,13 @@
 from django import VERSION
-from django.test import TestCase
+from django.test import SimpleTestCase
 
 
 if VERSION < (1, 7):
     from adv_cache_tag.compat import get_cache
 
-    class TestCase(TestCase):
+    class SimpleTestCase(SimpleTestCase):
         def setUp(self):
-            super(TestCase, self).setUp()
+            super(SimpleTestCase, self).setUp()
 
             # Override default cache in django < 1.7 because it is initialized before our
             # `override_settings`
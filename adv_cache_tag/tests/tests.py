@@ -1,10 +1,13 @@
 import hashlib
+import itertools
 import pickle
 import time
 import zlib
 
 from copy import deepcopy
 from datetime import datetime
+from functools import lru_cache
+from unittest import skipIf
 
 from django.conf import settings
 from django.utils.encoding import force_bytes
@@ -15,10 +18,46 @@ from django.test.utils import override_settings
 # from django.utils.http import 
 from urllib.parse import quote as urlquote
 
+from adv_cache_tag import compat
 from adv_cache_tag.compat import get_cache, template
-from adv_cache_tag.tag import CacheTag
+from adv_cache_tag.tag import CacheTag, is_template_debug_activated
 
-from .compat import TestCase
+from .compat import SimpleTestCase
+
+try:
+    from isal import isal_zlib
+except ImportError:
+    isal_zlib = None
+
+
+# The ``RAW_TOKEN`` derived from the ``SECRET_KEY`` forced below. It must stay the one computed
+# by ``CacheTag`` because it's the name under which the "raw" templatetag is registered.
+RAW_TOKEN = 'RAW_38a11088962625eb8c913e791931e2bc2e3c7228'
+
+# ``(RAW_TOKEN, RAW_TOKEN_START, RAW_TOKEN_END)`` already computed, by ``SECRET_KEY``
+_RAW_TOKEN_CACHE = {}
+
+# Dates used as ``obj.updated_at`` in templates
+UPDATED_AT = datetime(2015, 10, 27, 0, 0, 0)
+NEW_UPDATED_AT = datetime(2015, 10, 28, 0, 0, 0)
+
+# Expected compressed contents in the compression tests. We use ``SafeText`` as django does in
+# templates, except when spaces are compressed because it's converted back to a real string
+COMPRESSED_FOOBAR = zlib.compress(pickle.dumps(SafeText("  foobar  ")), -1)
+COMPRESSED_FOOBAR_LEVEL_9 = zlib.compress(pickle.dumps(SafeText("  foobar  ")), 9)
+COMPRESSED_FOOBAR_SPACELESS = zlib.compress(pickle.dumps(" foobar "))
+
+
+@lru_cache(maxsize=128)
+def compose_template_key(fragment_name, vary_on, prefix):
+    """Compose the cache key of a template, computed only once for a given ``vary_on`` tuple.
+
+    ``vary_on`` must be a tuple of values already passed to ``force_bytes``: equal values that
+    are encoded differently (like ``1`` and ``True``) must not share the same cached key.
+    """
+    key = ':'.join([urlquote(var) for var in vary_on])
+    args = hashlib.md5(force_bytes(key))
+    return (prefix + '.%s.%s') % (fragment_name, args.hexdigest())
 
 
 # Force some settings to not depend on the external ones
@@ -63,56 +102,98 @@ from .compat import TestCase
         },
     ]
 )
-class BasicTestCase(TestCase):
-    """First basic test case to be able to test python/django compatibility."""
+class BaseTestCase(SimpleTestCase):
+    """Base of all test cases, with helpers and settings not depending on the external ones."""
+
+    # ``CacheTag`` options to reset from settings: option name, setting name, default value
+    OPTIONS_SETTINGS = (
+        ('versioning', 'ADV_CACHE_VERSIONING', False),
+        ('compress', 'ADV_CACHE_COMPRESS', False),
+        ('compress_level', 'ADV_CACHE_COMPRESS_LEVEL', False),
+        ('compress_spaces', 'ADV_CACHE_COMPRESS_SPACES', False),
+        ('include_pk', 'ADV_CACHE_INCLUDE_PK', False),
+        ('cache_backend', 'ADV_CACHE_BACKEND', 'default'),
+        ('resolve_fragment', 'ADV_CACHE_RESOLVE_NAME', False),
+    )
+
+    # Data of the object to cache in template, copied for each test
+    OBJ_PROTOTYPE = {
+        'pk': 42,
+        'name': 'foobar',
+        'updated_at': UPDATED_AT,
+    }
+
+    # The template used by most tests, with its rendered content and its content in cache
+    DEFAULT_TEMPLATE = """
+            {% load adv_cache %}
+            {% cache 1 test_cached_template obj.pk obj.updated_at %}
+                {{ obj.get_name }}
+            {% endcache %}
+        """
+    DEFAULT_EXPECTED = "foobar"
+    DEFAULT_CACHE_EXPECTED = b"1::\n                foobar"
 
     @classmethod
     def reload_config(cls):
         """Resest the ``CacheTag`` configuration from current settings"""
-        CacheTag.options.versioning = getattr(settings, 'ADV_CACHE_VERSIONING', False)
-        CacheTag.options.compress = getattr(settings, 'ADV_CACHE_COMPRESS', False)
-        CacheTag.options.compress_level = getattr(settings, 'ADV_CACHE_COMPRESS_LEVEL', False)
-        CacheTag.options.compress_spaces = getattr(settings, 'ADV_CACHE_COMPRESS_SPACES', False)
-        CacheTag.options.include_pk = getattr(settings, 'ADV_CACHE_INCLUDE_PK', False)
-        CacheTag.options.cache_backend = getattr(settings, 'ADV_CACHE_BACKEND', 'default')
-        CacheTag.options.resolve_fragment = getattr(settings, 'ADV_CACHE_RESOLVE_NAME', False)
-
-        # generate a token for this site, based on the secret_key
-        CacheTag.RAW_TOKEN = 'RAW_' + hashlib.sha1(
-            b'RAW_TOKEN_SALT1' + force_bytes(hashlib.sha1(
-                b'RAW_TOKEN_SALT2' + force_bytes(settings.SECRET_KEY)
-            ).hexdigest())
-        ).hexdigest()
-
-        # tokens to use around the already parsed parts of the cached template
-        CacheTag.RAW_TOKEN_START = template.BLOCK_TAG_START + CacheTag.RAW_TOKEN + \
-                                   template.BLOCK_TAG_END
-        CacheTag.RAW_TOKEN_END = template.BLOCK_TAG_START + 'end' + CacheTag.RAW_TOKEN + \
-                                 template.BLOCK_TAG_END
+        CacheTag.options.__dict__.update({
+            name: getattr(settings, setting_name, default)
+            for name, setting_name, default in cls.OPTIONS_SETTINGS
+        })
+
+        secret_key = settings.SECRET_KEY
+        if secret_key not in _RAW_TOKEN_CACHE:
+
+            # generate a token for this site, based on the secret_key
+            # (same as in ``CacheTag`` but feeding the hashes without concatenating the salts)
+            secret_hash = hashlib.sha1(b'RAW_TOKEN_SALT2')
+            secret_hash.update(force_bytes(secret_key))
+            token_hash = hashlib.sha1(b'RAW_TOKEN_SALT1')
+            token_hash.update(force_bytes(secret_hash.hexdigest()))
+            raw_token = 'RAW_' + token_hash.hexdigest()
+
+            # tokens to use around the already parsed parts of the cached template
+            _RAW_TOKEN_CACHE[secret_key] = (
+                raw_token,
+                ''.join((template.BLOCK_TAG_START, raw_token, template.BLOCK_TAG_END)),
+                ''.join((template.BLOCK_TAG_START, 'end', raw_token, template.BLOCK_TAG_END)),
+            )
+
+        CacheTag.RAW_TOKEN, CacheTag.RAW_TOKEN_START, CacheTag.RAW_TOKEN_END = \
+            _RAW_TOKEN_CACHE[secret_key]
+
+    @classmethod
+    def setUpClass(cls):
+        """Prepare the storage of the compiled templates, shared by all the tests."""
+        super(BaseTestCase, cls).setUpClass()
+
+        # Compiled templates by text, ``versioning`` option and templates debug mode
+        cls._templates = {}
+
+        # The cache backends to clear (``CACHES`` is only overridden for the whole class)
+        cls._cache_handles = [get_cache(cache_name) for cache_name in settings.CACHES]
 
     def setUp(self):
         """Clean stuff and create an object to use in templates, and some counters."""
-        super(BasicTestCase, self).setUp()
+        super(BaseTestCase, self).setUp()
 
-        # Clear the cache
-        for cache_name in settings.CACHES:
-            get_cache(cache_name).clear()
+        # Clear the cache (only here: caches are not cleared at the end of each test, as this is
+        # enough for every test to start with empty caches)
+        for cache in self._cache_handles:
+            cache.clear()
 
         # Reset CacheTag config with default value (from the ``override_settings``)
         self.reload_config()
 
-        # And an object to cache in template
-        self.obj = {
-            'pk': 42,
-            'name': 'foobar',
-            'get_name': self.get_name,
-            'get_foo': self.get_foo,
-            'updated_at': datetime(2015, 10, 27, 0, 0, 0),
-        }
+        # And an object to cache in template, with methods bound to this test
+        self.obj = self.OBJ_PROTOTYPE.copy()
+        self.obj['get_name'] = self.get_name
+        self.obj['get_foo'] = self.get_foo
 
         # To count the number of calls of ``get_name`` and ``get_foo``.
         self.get_name_called = 0
         self.get_foo_called = 0
+        self._foo_counter = itertools.count(1)
 
     def get_name(self):
         """Called in template when asking for ``obj.get_name``."""
@@ -121,16 +202,8 @@ class BasicTestCase(TestCase):
 
     def get_foo(self):
         """Called in template when asking for ``obj.get_foo``."""
-        self.get_foo_called += 1
-        return 'foo %d' % self.get_foo_called
-
-    def tearDown(self):
-        """Clear caches at the end."""
-
-        for cache_name in settings.CACHES:
-            get_cache(cache_name).clear()
-
-        super(BasicTestCase, self).tearDown()
+        self.get_foo_called = next(self._foo_counter)
+        return 'foo ' + str(self.get_foo_called)
 
     @classmethod
     def tearDownClass(cls):
@@ -139,23 +212,31 @@ class BasicTestCase(TestCase):
         # Reset CacheTag config after the end of ``override_settings``
         cls.reload_config()
 
-        super(BasicTestCase, cls).tearDownClass()
+        super(BaseTestCase, cls).tearDownClass()
 
     @staticmethod
     def get_template_key(fragment_name, vary_on=None, prefix='template.cache'):
         """Compose the cache key of a template."""
         if vary_on is None:
             vary_on = ()
-        key = ':'.join([urlquote(force_bytes(var)) for var in vary_on])
-        args = hashlib.md5(force_bytes(key))
-        return (prefix + '.%s.%s') % (fragment_name, args.hexdigest())
+        return compose_template_key(fragment_name, tuple(force_bytes(var) for var in vary_on),
+                                    prefix)
+
+    def get_template(self, template_text):
+        """Return the template for the given text, compiled only once for all the tests."""
+        # The ``versioning`` option is read when the tag is parsed, and the template must be
+        # compiled by a debug engine when templates debug mode is activated
+        key = (template_text, CacheTag.options.versioning, is_template_debug_activated())
+        if key not in self._templates:
+            self._templates[key] = template.Template(template_text)
+        return self._templates[key]
 
     def render(self, template_text, extend_context_dict=None):
         """Utils to render a template text with a context given as a dict."""
         context_dict = {'obj': self.obj}
         if extend_context_dict:
             context_dict.update(extend_context_dict)
-        return template.Template(template_text).render(template.Context(context_dict))
+        return self.get_template(template_text).render(template.Context(context_dict))
 
     def assertStripEqual(self, first, second):
         """Like ``assertEqual`` for strings, but after calling ``strip`` on both arguments."""
@@ -175,11 +256,61 @@ class BasicTestCase(TestCase):
 
         self.assertNotEqual(first, second)
 
+    def check_cache_flow(self, template_text, key, cache_expected, expected=None, context=None,
+                         cache_name='default'):
+        """Render a template twice, checking that the first rendering misses the cache and
+        fills it, and that the second one hits it.
+
+        ``cache_expected`` is the content expected in the ``cache_name`` cache for ``key``,
+        ``expected`` (``DEFAULT_EXPECTED`` by default) the rendered one, and ``context`` the
+        optional dict to add to the rendering context.
+        """
+        if expected is None:
+            expected = self.DEFAULT_EXPECTED
+        name_called = self.get_name_called
+
+        # Render a first time, should miss the cache
+        self.assertStripEqual(self.render(template_text, context), expected)
+        self.assertEqual(self.get_name_called, name_called + 1)
+
+        # Now the rendered template should be in cache
+        self.assertStripEqual(get_cache(cache_name).get(key), cache_expected)
+
+        # Render a second time, should hit the cache
+        self.assertStripEqual(self.render(template_text, context), expected)
+        self.assertEqual(self.get_name_called, name_called + 1)  # No more call
+
+    def set_template_debug_true(self):
+        if django_version < (1, 8):
+            return override_settings(TEMPLATE_DEBUG=True)
+
+        # not so simple now, it's an option of a template backend
+        templates_settings_copy = deepcopy(settings.TEMPLATES)
+        for template_settings in templates_settings_copy:
+            if template_settings['BACKEND'] == 'django.template.backends.django.DjangoTemplates':
+                template_settings.setdefault('OPTIONS', {})['debug'] = True
+        return override_settings(TEMPLATES=templates_settings_copy)
+
+
+class BasicTestCase(BaseTestCase):
+    """Tests with the default settings."""
+
+    def test_raw_token(self):
+        """Test that the ``RAW_TOKEN`` is the one used to register the "raw" templatetag."""
+
+        # The library registered the "raw" templatetag under the token computed at import time
+        from adv_cache_tag.templatetags.adv_cache import register
+        self.assertIn(RAW_TOKEN, register.tags)
+        self.assertIs(register.tags[RAW_TOKEN], CacheTag._templatetags[CacheTag]['raw'])
+
+        # And ``reload_config`` computes the same tokens
+        self.assertEqual(CacheTag.RAW_TOKEN, RAW_TOKEN)
+        self.assertEqual(CacheTag.RAW_TOKEN_START, '{%%%s%%}' % RAW_TOKEN)
+        self.assertEqual(CacheTag.RAW_TOKEN_END, '{%%end%s%%}' % RAW_TOKEN)
+
     def test_default_cache(self):
         """This test is only to validate the testing procedure."""
 
-        expected = "foobar"
-
         t = """
             {% load cache %}
             {% cache 1 test_cached_template obj.pk obj.updated_at %}
@@ -187,54 +318,27 @@ class BasicTestCase(TestCase):
             {% endcache %}
         """
 
-        # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)
-
-        # Now the rendered template should be in cache
         key = self.get_template_key('test_cached_template',
                                     vary_on=[self.obj['pk'], self.obj['updated_at']])
         self.assertEqual(
             key, 'template.cache.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
 
-        self.assertStripEqual(get_cache('default').get(key), expected)
-
-        # Render a second time, should hit the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)  # Still 1
+        # The django cache templatetag saves the rendered template as is
+        self.check_cache_flow(t, key, self.DEFAULT_EXPECTED)
 
     def test_adv_cache(self):
         """Test default behaviour with default settings."""
 
-        expected = "foobar"
-
-        t = """
-            {% load adv_cache %}
-            {% cache 1 test_cached_template obj.pk obj.updated_at %}
-                {{ obj.get_name }}
-            {% endcache %}
-        """
-
-        # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)
-
-        # Now the rendered template should be in cache
         key = self.get_template_key('test_cached_template',
                                     vary_on=[self.obj['pk'], self.obj['updated_at']])
         self.assertEqual(
             key, 'template.cache.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
 
-        # But it should NOT be the exact content as adv_cache_tag adds a version
-        self.assertNotStripEqual(get_cache('default').get(key), expected)
-
         # It should be the version from `adv_cache_tag`
-        cache_expected = b"1::\n                foobar"
-        self.assertStripEqual(get_cache('default').get(key), cache_expected)
+        self.check_cache_flow(self.DEFAULT_TEMPLATE, key, self.DEFAULT_CACHE_EXPECTED)
 
-        # Render a second time, should hit the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)  # Still 1
+        # So it should NOT be the exact content as adv_cache_tag adds a version
+        self.assertNotStripEqual(get_cache('default').get(key), self.DEFAULT_EXPECTED)
 
     def test_timeout_value(self):
         "Test that timeout value is ``None`` or an integer."""
@@ -351,245 +455,230 @@ class BasicTestCase(TestCase):
         cache_expected = b"1::\n                foobar bar"
         self.assertStripEqual(get_cache('default').get(key), cache_expected)
 
-    @override_settings(
-        ADV_CACHE_VERSIONING = True,
-    )
-    def test_versioning(self):
-        """Test with ``ADV_CACHE_VERSIONING`` set to ``True``."""
+    @skipIf(isal_zlib is None, 'python-isal is not installed')
+    def test_isal_decompression(self):
+        """Test that python-isal, when installed, decompresses data compressed by ``zlib``."""
 
-        # Reset CacheTag config with default value (from the ``override_settings``)
-        self.reload_config()
+        self.assertIs(compat.zlib_decompress, isal_zlib.decompress)
+        self.assertEqual(pickle.loads(compat.zlib_decompress(COMPRESSED_FOOBAR)), "  foobar  ")
+
+    def test_new_class(self):
+        """Test a new class based on ``CacheTag``."""
 
-        expected = "foobar"
+        expected = "foobar  foo 1  !!"
 
         t = """
-            {% load adv_cache %}
-            {% cache 1 test_cached_template obj.pk obj.updated_at %}
+            {% load adv_cache_test %}
+            {% cache_test 1 multiplicator test_cached_template obj.pk obj.updated_at %}
                 {{ obj.get_name }}
-            {% endcache %}
+                {% nocache_test %}
+                    {{ obj.get_foo }}
+                {% endnocache_test %}
+                !!
+            {% endcache_test %}
         """
 
         # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t), expected)
+        self.assertStripEqual(self.render(t, {'multiplicator': 10}), expected)
         self.assertEqual(self.get_name_called, 1)
+        self.assertEqual(self.get_foo_called, 1)
 
         # Now the rendered template should be in cache
-
-        # ``obj.updated_at`` is not in the key anymore, serving as the object version
-        key = self.get_template_key('test_cached_template', vary_on=[self.obj['pk']])
+        key = self.get_template_key('test_cached_template',
+                                    vary_on=[self.obj['pk'], self.obj['updated_at']],
+                                    prefix='template.cache_test')
         self.assertEqual(
-            key, 'template.cache.test_cached_template.a1d0c6e83f027327d8461063f4ac58a6')
-
-        # It should be in the cache, with the ``updated_at`` in the version
-        cache_expected = b"1::2015-10-27 00:00:00::\n                foobar"
-        self.assertStripEqual(get_cache('default').get(key), cache_expected)
-
-        # Render a second time, should hit the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)  # Still 1
-
-        # We can update the date
-        self.obj['updated_at'] = datetime(2015, 10, 28, 0, 0, 0)
-
-        # Render with the new date, we should miss the cache because of the new "version
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 2)  # One more
+            key, 'template.cache_test.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
 
-        # It should be in the cache, with the new ``updated_at`` in the version
-        cache_expected = b"1::2015-10-28 00:00:00::\n                foobar"
+        # It should be in the cache, with the RAW part
+        cache_expected = force_bytes("1:: foobar {%%end%s%%} {{obj.get_foo}} {%%%s%%} !! " % (
+            RAW_TOKEN, RAW_TOKEN))
         self.assertStripEqual(get_cache('default').get(key), cache_expected)
 
-        # Render a second time, should hit the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 2)  # Still 2
-
-    @override_settings(
-        ADV_CACHE_INCLUDE_PK = True,
-    )
-    def test_primary_key(self):
-        """Test with ``ADV_CACHE_INCLUDE_PK`` set to ``True``."""
+        # We'll check that our multiplicator was really applied
+        cache = get_cache('default')
+        expire_at = cache._expire_info[cache.make_key(key, version=None)]
+        now = time.time()
+        # In more that one second (default expiry we set) and less than ten
+        self.assertTrue(now + 1 < expire_at < now + 10)
 
-        # Reset CacheTag config with default value (from the ``override_settings``)
-        self.reload_config()
+        # Render a second time, should hit the cache but not for ``get_foo``
+        expected = "foobar  foo 2  !!"
+        self.assertStripEqual(self.render(t, {'multiplicator': 10}), expected)
+        self.assertEqual(self.get_name_called, 1)  # Still 1
+        self.assertEqual(self.get_foo_called, 2)  # One more call to the non-cached part
 
-        expected = "foobar"
+    def test_using_argument(self):
+        """Test passing the cache backend to use with the `using=` arg to the templatetag."""
 
         t = """
             {% load adv_cache %}
-            {% cache 1 test_cached_template obj.pk obj.updated_at %}
+            {% cache 1 test_cached_template obj.pk obj.updated_at using=foo %}
                 {{ obj.get_name }}
             {% endcache %}
         """
 
-        # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)
-
-        # Now the rendered template should be in cache
-
-        # We add the pk as a part to the fragment name
-        key = self.get_template_key('test_cached_template.%s' % self.obj['pk'],
+        key = self.get_template_key('test_cached_template',
                                     vary_on=[self.obj['pk'], self.obj['updated_at']])
         self.assertEqual(
-            key, 'template.cache.test_cached_template.42.0cac9a03d5330dd78ddc9a0c16f01403')
-
-        # It should be in the cache
-        cache_expected = b"1::\n                foobar"
-        self.assertStripEqual(get_cache('default').get(key), cache_expected)
-
-        # Render a second time, should hit the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)  # Still 1
+            key, 'template.cache.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
 
-    @override_settings(
-        ADV_CACHE_COMPRESS_SPACES = True,
-    )
-    def test_space_compression(self):
-        """Test with ``ADV_CACHE_COMPRESS_SPACES`` set to ``True``."""
+        # It should be in the ``foo`` cache
+        self.check_cache_flow(t, key, self.DEFAULT_CACHE_EXPECTED, cache_name='foo')
 
-        # Reset CacheTag config with default value (from the ``override_settings``)
-        self.reload_config()
+        # But not in the ``default`` cache
+        self.assertIsNone(get_cache('default').get(key))
 
-        expected = "foobar"
+    def test_failure_when_setting_cache(self):
+        """Test that the template is correctly rendered even if the cache cannot be filled."""
 
         t = """
-            {% load adv_cache %}
-            {% cache 1 test_cached_template obj.pk obj.updated_at %}
+            {% load adv_cache_test %}
+            {% cache_set_fail 1 test_cached_template obj.pk obj.updated_at %}
                 {{ obj.get_name }}
-            {% endcache %}
+            {% endcache_set_fail %}
         """
 
-        # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)
+        # Render a first time, should still be rendered
+        self.assertStripEqual(self.render(t), self.DEFAULT_EXPECTED)
 
-        # Now the rendered template should be in cache
+        # Now the rendered template should NOT be in cache
         key = self.get_template_key('test_cached_template',
-                                    vary_on=[self.obj['pk'], self.obj['updated_at']])
+                                    vary_on=[self.obj['pk'], self.obj['updated_at']],
+                                    prefix='template.cache_set_fail')
         self.assertEqual(
-            key, 'template.cache.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
-
-        # It should be in the cache, with only one space instead of many white spaces
-        cache_expected = b"1:: foobar "
-        # Test with ``assertEqual``, not ``assertStripEqual``
-        self.assertEqual(get_cache('default').get(key), cache_expected)
-
-        # Render a second time, should hit the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)  # Still 1
+            key, 'template.cache_set_fail.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
 
-    @override_settings(
-        ADV_CACHE_COMPRESS = True,
-    )
-    def test_compression(self):
-        """Test with ``ADV_CACHE_COMPRESS`` set to ``True``."""
+        # But not in the ``default`` cache
+        self.assertIsNone(get_cache('default').get(key))
 
-        # Reset CacheTag config with default value (from the ``override_settings``)
-        self.reload_config()
+        # It should raise if templates debug mode is activated
+        with self.set_template_debug_true():
+            with self.assertRaises(ValueError) as raise_context:
+                self.render(t)
+            self.assertIn('boom set', str(raise_context.exception))
 
-        expected = "foobar"
+    def test_failure_when_getting_cache(self):
+        """Test that the template is correctly rendered even if the cache cannot be read."""
 
-        # We don't use new lines here because too complicated to set empty lines with only
-        # spaces in a docstring with we'll have to compute the compressed version
-        t = "{% load adv_cache %}{% cache 1 test_cached_template obj.pk obj.updated_at %}" \
-            "  {{ obj.get_name }}  {% endcache %}"
+        t = """
+            {% load adv_cache_test %}
+            {% cache_get_fail 1 test_cached_template obj.pk obj.updated_at %}
+                {{ obj.get_name }}
+            {% endcache_get_fail %}
+        """
 
-        # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)
+        # Render a first time, should still be rendered
+        self.assertStripEqual(self.render(t), self.DEFAULT_EXPECTED)
 
         # Now the rendered template should be in cache
         key = self.get_template_key('test_cached_template',
-                                    vary_on=[self.obj['pk'], self.obj['updated_at']])
+                                    vary_on=[self.obj['pk'], self.obj['updated_at']],
+                                    prefix='template.cache_get_fail')
         self.assertEqual(
-            key, 'template.cache.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
+            key, 'template.cache_get_fail.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
 
-        # It should be in the cache, compressed
-        # We use ``SafeText`` as django does in templates
-        compressed = zlib.compress(pickle.dumps(SafeText("  foobar  ")), -1)
-        cache_expected = b'1::' + compressed
-        # Test with ``assertEqual``, not ``assertStripEqual``
-        self.assertEqual(get_cache('default').get(key), cache_expected)
+        # It should be in the cache
+        self.assertStripEqual(get_cache('default').get(key), self.DEFAULT_CACHE_EXPECTED)
 
-        # Render a second time, should hit the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)  # Still 1
+        # It should raise if templates debug mode is activated
+        with self.set_template_debug_true():
+            with self.assertRaises(ValueError) as raise_context:
+                self.render(t)
+            self.assertIn('boom get', str(raise_context.exception))
 
-        # Changing the compression level should not invalidate the cache
-        CacheTag.options.compress_level = 9
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)  # Still 1
 
-        # But if the cache is invalidated, the new one will use this new level
-        get_cache('default').delete(key)
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 2)  # One more
-        compressed = zlib.compress(pickle.dumps(SafeText("  foobar  ")), 9)
-        cache_expected = b'1::' + compressed
-        self.assertEqual(get_cache('default').get(key), cache_expected)
+@override_settings(
+    ADV_CACHE_VERSIONING = True,
+)
+class VersioningTestCase(BaseTestCase):
+    """Tests with ``ADV_CACHE_VERSIONING`` set to ``True``."""
 
+    def test_versioning(self):
+        """Test with ``ADV_CACHE_VERSIONING`` set to ``True``."""
 
-    @override_settings(
-        ADV_CACHE_COMPRESS = True,
-        ADV_CACHE_COMPRESS_SPACES = True,
-    )
-    def test_full_compression(self):
-        """Test with ``ADV_CACHE_COMPRESS`` and ``ADV_CACHE_COMPRESS_SPACES`` set to ``True``."""
+        # ``obj.updated_at`` is not in the key anymore, serving as the object version
+        key = self.get_template_key('test_cached_template', vary_on=[self.obj['pk']])
+        self.assertEqual(
+            key, 'template.cache.test_cached_template.a1d0c6e83f027327d8461063f4ac58a6')
 
-        # Reset CacheTag config with default value (from the ``override_settings``)
-        self.reload_config()
+        # It should be in the cache, with the ``updated_at`` in the version
+        self.check_cache_flow(self.DEFAULT_TEMPLATE, key,
+                              b"1::2015-10-27 00:00:00::\n                foobar")
+        self.assertEqual(self.get_name_called, 1)
+
+        # We can update the date: we should miss the cache because of the new "version", and
+        # it should be in the cache, with the new ``updated_at`` in the version
+        self.obj['updated_at'] = NEW_UPDATED_AT
+        self.check_cache_flow(self.DEFAULT_TEMPLATE, key,
+                              b"1::2015-10-28 00:00:00::\n                foobar")
+        self.assertEqual(self.get_name_called, 2)
 
-        expected = "foobar"
+    def test_internal_version(self):
+        """Test a cache with `Meta.internal_version` set."""
 
         t = """
-            {% load adv_cache %}
-            {% cache 1 test_cached_template obj.pk obj.updated_at %}
+            {% load adv_cache_test %}
+            {% cache_with_version 1 test_cache_with_version obj.pk %}
                 {{ obj.get_name }}
-            {% endcache %}
+            {% endcache_with_version %}
         """
 
         # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t), expected)
+        self.assertStripEqual(self.render(t), self.DEFAULT_EXPECTED)
         self.assertEqual(self.get_name_called, 1)
 
-        # Now the rendered template should be in cache
-        key = self.get_template_key('test_cached_template',
-                                    vary_on=[self.obj['pk'], self.obj['updated_at']])
-        self.assertEqual(
-            key, 'template.cache.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
+        # It should be in the cache, with the ``internal_version`` in the version
+        key = 'template.cache_with_version.test_cache_with_version.a1d0c6e83f027327d8461063f4ac58a6'
+        cache_expected = b"1|v1::\n                foobar"
+        self.assertStripEqual(get_cache('default').get(key), cache_expected)
 
-        # It should be in the cache, compressed
-        # We DON'T use ``SafeText`` as in ``test_compression`` because with was converted back
-        # to a real string when removing spaces
-        compressed = zlib.compress(pickle.dumps(" foobar "))
-        cache_expected = b'1::' + compressed
-        # Test with ``assertEqual``, not ``assertStripEqual``
-        self.assertEqual(get_cache('default').get(key), cache_expected)
+        self.get_name_called = 0
+        # Calling it a new time should hit the cache
+        self.assertStripEqual(self.render(t), self.DEFAULT_EXPECTED)
+        self.assertEqual(self.get_name_called, 0)
 
-        # Render a second time, should hit the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)  # Still 1
+        # Changing the interval version should miss the cache
+        from .testproject.adv_cache_test_app.templatetags.adv_cache_test import InternalVersionTag
+        InternalVersionTag.options.internal_version = 'v2'
+        self.assertStripEqual(self.render(t), self.DEFAULT_EXPECTED)
+        self.assertEqual(self.get_name_called, 1)
 
-    @override_settings(
-        ADV_CACHE_BACKEND = 'foo',
-    )
-    def test_cache_backend(self):
-        """Test with ``ADV_CACHE_BACKEND`` to another value than ``default``."""
+        # It should be in the cache, with the new ``internal_version`` in the version
+        key = 'template.cache_with_version.test_cache_with_version.a1d0c6e83f027327d8461063f4ac58a6'
+        cache_expected = b"1|v2::\n                foobar"
+        self.assertStripEqual(get_cache('default').get(key), cache_expected)
 
-        # Reset CacheTag config with default value (from the ``override_settings``)
-        self.reload_config()
 
-        expected = "foobar"
+@override_settings(
+    ADV_CACHE_INCLUDE_PK = True,
+)
+class PrimaryKeyTestCase(BaseTestCase):
+    """Tests with ``ADV_CACHE_INCLUDE_PK`` set to ``True``."""
 
-        t = """
-            {% load adv_cache %}
-            {% cache 1 test_cached_template obj.pk obj.updated_at %}
-                {{ obj.get_name }}
-            {% endcache %}
-        """
+    def test_primary_key(self):
+        """Test with ``ADV_CACHE_INCLUDE_PK`` set to ``True``."""
+
+        # We add the pk as a part to the fragment name
+        key = self.get_template_key('test_cached_template.%s' % self.obj['pk'],
+                                    vary_on=[self.obj['pk'], self.obj['updated_at']])
+        self.assertEqual(
+            key, 'template.cache.test_cached_template.42.0cac9a03d5330dd78ddc9a0c16f01403')
+
+        self.check_cache_flow(self.DEFAULT_TEMPLATE, key, self.DEFAULT_CACHE_EXPECTED)
+
+
+@override_settings(
+    ADV_CACHE_COMPRESS_SPACES = True,
+)
+class SpaceCompressionTestCase(BaseTestCase):
+    """Tests with ``ADV_CACHE_COMPRESS_SPACES`` set to ``True``."""
+
+    def test_space_compression(self):
+        """Test with ``ADV_CACHE_COMPRESS_SPACES`` set to ``True``."""
 
         # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t), expected)
+        self.assertStripEqual(self.render(self.DEFAULT_TEMPLATE), self.DEFAULT_EXPECTED)
         self.assertEqual(self.get_name_called, 1)
 
         # Now the rendered template should be in cache
@@ -598,28 +687,18 @@ class BasicTestCase(TestCase):
         self.assertEqual(
             key, 'template.cache.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
 
-        # It should be in the cache
-        cache_expected = b"1::\n                foobar"
-
-        # But not in the ``default`` cache
-        self.assertIsNone(get_cache('default').get(key))
-
-        # But in the ``foo`` cache
-        self.assertStripEqual(get_cache('foo').get(key), cache_expected)
+        # It should be in the cache, with only one space instead of many white spaces
+        cache_expected = b"1:: foobar "
+        # Test with ``assertEqual``, not ``assertStripEqual``
+        self.assertEqual(get_cache('default').get(key), cache_expected)
 
         # Render a second time, should hit the cache
-        self.assertStripEqual(self.render(t), expected)
+        self.assertStripEqual(self.render(self.DEFAULT_TEMPLATE), self.DEFAULT_EXPECTED)
         self.assertEqual(self.get_name_called, 1)  # Still 1
 
-    @override_settings(
-        ADV_CACHE_COMPRESS_SPACES = True,
-    )
     def test_partial_cache(self):
         """Test the ``nocache`` templatetag."""
 
-        # Reset CacheTag config with default value (from the ``override_settings``)
-        self.reload_config()
-
         expected = "foobar  foo 1  !!"
 
         t = """
@@ -645,8 +724,8 @@ class BasicTestCase(TestCase):
             key, 'template.cache.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
 
         # It should be in the cache, with the RAW part
-        cache_expected = b"1:: foobar {%endRAW_38a11088962625eb8c913e791931e2bc2e3c7228%} " \
-                         b"{{obj.get_foo}} {%RAW_38a11088962625eb8c913e791931e2bc2e3c7228%} !! "
+        cache_expected = force_bytes("1:: foobar {%%end%s%%} {{obj.get_foo}} {%%%s%%} !! " % (
+            RAW_TOKEN, RAW_TOKEN))
         self.assertStripEqual(get_cache('default').get(key), cache_expected)
 
         # Render a second time, should hit the cache but not for ``get_foo``
@@ -655,115 +734,51 @@ class BasicTestCase(TestCase):
         self.assertEqual(self.get_name_called, 1)  # Still 1
         self.assertEqual(self.get_foo_called, 2)  # One more call to the non-cached part
 
-    @override_settings(
-        ADV_CACHE_VERSIONING = True,
-    )
-    def test_internal_version(self):
-        """Test a cache with `Meta.internal_version` set."""
-
-        # Reset CacheTag config with default value (from the ``override_settings``)
-        self.reload_config()
-
-        expected = "foobar"
-
-        t = """
-            {% load adv_cache_test %}
-            {% cache_with_version 1 test_cache_with_version obj.pk %}
-                {{ obj.get_name }}
-            {% endcache_with_version %}
-        """
-
-        # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)
-
-        # It should be in the cache, with the ``internal_version`` in the version
-        key = 'template.cache_with_version.test_cache_with_version.a1d0c6e83f027327d8461063f4ac58a6'
-        cache_expected = b"1|v1::\n                foobar"
-        self.assertStripEqual(get_cache('default').get(key), cache_expected)
-
-        self.get_name_called = 0
-        # Calling it a new time should hit the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 0)
-
-        # Changing the interval version should miss the cache
-        from .testproject.adv_cache_test_app.templatetags.adv_cache_test import InternalVersionTag
-        InternalVersionTag.options.internal_version = 'v2'
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)
-
-        # It should be in the cache, with the new ``internal_version`` in the version
-        key = 'template.cache_with_version.test_cache_with_version.a1d0c6e83f027327d8461063f4ac58a6'
-        cache_expected = b"1|v2::\n                foobar"
-        self.assertStripEqual(get_cache('default').get(key), cache_expected)
-
-    def test_new_class(self):
-        """Test a new class based on ``CacheTag``."""
+    def test_loading_libraries_in_nocache(self):
+        """Test that needed libraries are loaded in the nocache block."""
 
-        expected = "foobar  foo 1  !!"
+        expected = "foobar FoOoO   FOO 1FOO 1 FoOoO  !!"
 
         t = """
-            {% load adv_cache_test %}
-            {% cache_test 1 multiplicator test_cached_template obj.pk obj.updated_at %}
-                {{ obj.get_name }}
-                {% nocache_test %}
-                    {{ obj.get_foo }}
-                {% endnocache_test %}
+            {% load adv_cache other_tags %}
+            {% cache 1 test_cached_template obj.pk obj.updated_at %}
+                {{ obj.get_name }} {% insert_foo %}
+                {% nocache %}
+                    {% load other_filters %}
+                    {{ obj.get_foo|double_upper }} {% insert_foo %}
+                {% endnocache %}
                 !!
-            {% endcache_test %}
+            {% endcache %}
         """
 
         # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t, {'multiplicator': 10}), expected)
+        self.assertStripEqual(self.render(t), expected)
         self.assertEqual(self.get_name_called, 1)
         self.assertEqual(self.get_foo_called, 1)
 
-        # Now the rendered template should be in cache
-        key = self.get_template_key('test_cached_template',
-                                    vary_on=[self.obj['pk'], self.obj['updated_at']],
-                                    prefix='template.cache_test')
-        self.assertEqual(
-            key, 'template.cache_test.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
-
-        # It should be in the cache, with the RAW part
-        cache_expected = b"1:: foobar {%endRAW_38a11088962625eb8c913e791931e2bc2e3c7228%} " \
-                         b"{{obj.get_foo}} {%RAW_38a11088962625eb8c913e791931e2bc2e3c7228%} !! "
-        self.assertStripEqual(get_cache('default').get(key), cache_expected)
-
-        # We'll check that our multiplicator was really applied
-        cache = get_cache('default')
-        expire_at = cache._expire_info[cache.make_key(key, version=None)]
-        now = time.time()
-        # In more that one second (default expiry we set) and less than ten
-        self.assertTrue(now + 1 < expire_at < now + 10)
-
         # Render a second time, should hit the cache but not for ``get_foo``
-        expected = "foobar  foo 2  !!"
-        self.assertStripEqual(self.render(t, {'multiplicator': 10}), expected)
+        expected = "foobar FoOoO   FOO 2FOO 2 FoOoO  !!"
+        self.assertStripEqual(self.render(t), expected)
         self.assertEqual(self.get_name_called, 1)  # Still 1
         self.assertEqual(self.get_foo_called, 2)  # One more call to the non-cached part
 
-    @override_settings(
-        ADV_CACHE_RESOLVE_NAME = True,
-    )
-    def test_resolve_fragment_name(self):
-        """Test passing the fragment name as a variable."""
 
-        # Reset CacheTag config with default value (from the ``override_settings``)
-        self.reload_config()
+@override_settings(
+    ADV_CACHE_COMPRESS = True,
+)
+class CompressionTestCase(BaseTestCase):
+    """Tests with ``ADV_CACHE_COMPRESS`` set to ``True``."""
 
-        expected = "foobar"
+    def test_compression(self):
+        """Test with ``ADV_CACHE_COMPRESS`` set to ``True``."""
 
-        t = """
-            {% load adv_cache %}
-            {% cache 1 fragment_name obj.pk obj.updated_at %}
-                {{ obj.get_name }}
-            {% endcache %}
-        """
+        # We don't use new lines here because too complicated to set empty lines with only
+        # spaces in a docstring with we'll have to compute the compressed version
+        t = "{% load adv_cache %}{% cache 1 test_cached_template obj.pk obj.updated_at %}" \
+            "  {{ obj.get_name }}  {% endcache %}"
 
         # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t, {'fragment_name': 'test_cached_template'}), expected)
+        self.assertStripEqual(self.render(t), self.DEFAULT_EXPECTED)
         self.assertEqual(self.get_name_called, 1)
 
         # Now the rendered template should be in cache
@@ -772,49 +787,40 @@ class BasicTestCase(TestCase):
         self.assertEqual(
             key, 'template.cache.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
 
-        # But it should NOT be the exact content as adv_cache_tag adds a version
-        self.assertNotStripEqual(get_cache('default').get(key), expected)
-
-        # It should be the version from `adv_cache_tag`
-        cache_expected = b"1::\n                foobar"
-        self.assertStripEqual(get_cache('default').get(key), cache_expected)
+        # It should be in the cache, compressed
+        cache_expected = b'1::' + COMPRESSED_FOOBAR
+        # Test with ``assertEqual``, not ``assertStripEqual``
+        self.assertEqual(get_cache('default').get(key), cache_expected)
 
         # Render a second time, should hit the cache
-        self.assertStripEqual(self.render(t, {'fragment_name': 'test_cached_template'}), expected)
+        self.assertStripEqual(self.render(t), self.DEFAULT_EXPECTED)
         self.assertEqual(self.get_name_called, 1)  # Still 1
 
-        # Using an undefined variable should fail
-        t = """
-            {% load adv_cache %}
-            {% cache 1 undefined_fragment_name obj.pk obj.updated_at %}
-                {{ obj.get_name }}
-            {% endcache %}
-        """
-
-        with self.assertRaises(template.VariableDoesNotExist) as raise_context:
-            self.render(t, {'fragment_name': 'test_cached_template'})
-        self.assertIn('undefined_fragment_name', str(raise_context.exception))
+        # Changing the compression level should not invalidate the cache
+        CacheTag.options.compress_level = 9
+        self.assertStripEqual(self.render(t), self.DEFAULT_EXPECTED)
+        self.assertEqual(self.get_name_called, 1)  # Still 1
 
-    @override_settings(
-        ADV_CACHE_RESOLVE_NAME = True,
-    )
-    def test_passing_fragment_name_as_string(self):
-        """Test passing the fragment name as a variable."""
+        # But if the cache is invalidated, the new one will use this new level
+        get_cache('default').delete(key)
+        self.assertStripEqual(self.render(t), self.DEFAULT_EXPECTED)
+        self.assertEqual(self.get_name_called, 2)  # One more
+        cache_expected = b'1::' + COMPRESSED_FOOBAR_LEVEL_9
+        self.assertEqual(get_cache('default').get(key), cache_expected)
 
-        # Reset CacheTag config with default value (from the ``override_settings``)
-        self.reload_config()
 
-        expected = "foobar"
+@override_settings(
+    ADV_CACHE_COMPRESS = True,
+    ADV_CACHE_COMPRESS_SPACES = True,
+)
+class FullCompressionTestCase(BaseTestCase):
+    """Tests with ``ADV_CACHE_COMPRESS`` and ``ADV_CACHE_COMPRESS_SPACES`` set to ``True``."""
 
-        t = """
-            {% load adv_cache %}
-            {% cache 1 "test_cached_template" obj.pk obj.updated_at %}
-                {{ obj.get_name }}
-            {% endcache %}
-        """
+    def test_full_compression(self):
+        """Test with ``ADV_CACHE_COMPRESS`` and ``ADV_CACHE_COMPRESS_SPACES`` set to ``True``."""
 
         # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t), expected)
+        self.assertStripEqual(self.render(self.DEFAULT_TEMPLATE), self.DEFAULT_EXPECTED)
         self.assertEqual(self.get_name_called, 1)
 
         # Now the rendered template should be in cache
@@ -823,156 +829,87 @@ class BasicTestCase(TestCase):
         self.assertEqual(
             key, 'template.cache.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
 
-        # But it should NOT be the exact content as adv_cache_tag adds a version
-        self.assertNotStripEqual(get_cache('default').get(key), expected)
-
-        # It should be the version from `adv_cache_tag`
-        cache_expected = b"1::\n                foobar"
-        self.assertStripEqual(get_cache('default').get(key), cache_expected)
+        # It should be in the cache, compressed (without ``SafeText``, see ``COMPRESSED_FOOBAR``)
+        cache_expected = b'1::' + COMPRESSED_FOOBAR_SPACELESS
+        # Test with ``assertEqual``, not ``assertStripEqual``
+        self.assertEqual(get_cache('default').get(key), cache_expected)
 
         # Render a second time, should hit the cache
-        self.assertStripEqual(self.render(t), expected)
+        self.assertStripEqual(self.render(self.DEFAULT_TEMPLATE), self.DEFAULT_EXPECTED)
         self.assertEqual(self.get_name_called, 1)  # Still 1
 
-    def test_using_argument(self):
-        """Test passing the cache backend to use with the `using=` arg to the templatetag."""
-
-        expected = "foobar"
 
-        t = """
-            {% load adv_cache %}
-            {% cache 1 test_cached_template obj.pk obj.updated_at using=foo %}
-                {{ obj.get_name }}
-            {% endcache %}
-        """
+@override_settings(
+    ADV_CACHE_BACKEND = 'foo',
+)
+class CacheBackendTestCase(BaseTestCase):
+    """Tests with ``ADV_CACHE_BACKEND`` set to another value than ``default``."""
 
-        # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)
+    def test_cache_backend(self):
+        """Test with ``ADV_CACHE_BACKEND`` to another value than ``default``."""
 
-        # Now the rendered template should be in cache
         key = self.get_template_key('test_cached_template',
                                     vary_on=[self.obj['pk'], self.obj['updated_at']])
         self.assertEqual(
             key, 'template.cache.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
 
-        # It should be in the cache
-        cache_expected = b"1::\n                foobar"
+        # It should be in the ``foo`` cache
+        self.check_cache_flow(self.DEFAULT_TEMPLATE, key, self.DEFAULT_CACHE_EXPECTED,
+                              cache_name='foo')
 
         # But not in the ``default`` cache
         self.assertIsNone(get_cache('default').get(key))
 
-        # But in the ``foo`` cache
-        self.assertStripEqual(get_cache('foo').get(key), cache_expected)
-
-        # Render a second time, should hit the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)  # Still 1
-
-    @override_settings(
-        ADV_CACHE_COMPRESS_SPACES = True,
-    )
-    def test_loading_libraries_in_nocache(self):
-        """Test that needed libraries are loaded in the nocache block."""
 
-        # Reset CacheTag config with default value (from the ``override_settings``)
-        self.reload_config()
+@override_settings(
+    ADV_CACHE_RESOLVE_NAME = True,
+)
+class ResolveFragmentNameTestCase(BaseTestCase):
+    """Tests with ``ADV_CACHE_RESOLVE_NAME`` set to ``True``."""
 
-        expected = "foobar FoOoO   FOO 1FOO 1 FoOoO  !!"
+    def test_resolve_fragment_name(self):
+        """Test passing the fragment name as a variable."""
 
         t = """
-            {% load adv_cache other_tags %}
-            {% cache 1 test_cached_template obj.pk obj.updated_at %}
-                {{ obj.get_name }} {% insert_foo %}
-                {% nocache %}
-                    {% load other_filters %}
-                    {{ obj.get_foo|double_upper }} {% insert_foo %}
-                {% endnocache %}
-                !!
+            {% load adv_cache %}
+            {% cache 1 fragment_name obj.pk obj.updated_at %}
+                {{ obj.get_name }}
             {% endcache %}
         """
 
-        # Render a first time, should miss the cache
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)
-        self.assertEqual(self.get_foo_called, 1)
-
-        # Render a second time, should hit the cache but not for ``get_foo``
-        expected = "foobar FoOoO   FOO 2FOO 2 FoOoO  !!"
-        self.assertStripEqual(self.render(t), expected)
-        self.assertEqual(self.get_name_called, 1)  # Still 1
-        self.assertEqual(self.get_foo_called, 2)  # One more call to the non-cached part
-
-    def set_template_debug_true(self):
-        if django_version < (1, 8):
-            return override_settings(TEMPLATE_DEBUG=True)
-
-        # not so simple now, it's an option of a template backend
-        templates_settings_copy = deepcopy(settings.TEMPLATES)
-        for template_settings in templates_settings_copy:
-            if template_settings['BACKEND'] == 'django.template.backends.django.DjangoTemplates':
-                template_settings.setdefault('OPTIONS', {})['debug'] = True
-        return override_settings(TEMPLATES=templates_settings_copy)
-
-    def test_failure_when_setting_cache(self):
-        """Test that the template is correctly rendered even if the cache cannot be filled."""
+        key = self.get_template_key('test_cached_template',
+                                    vary_on=[self.obj['pk'], self.obj['updated_at']])
+        self.assertEqual(
+            key, 'template.cache.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
 
-        expected = "foobar"
+        self.check_cache_flow(t, key, self.DEFAULT_CACHE_EXPECTED,
+                              context={'fragment_name': 'test_cached_template'})
 
+        # Using an undefined variable should fail
         t = """
-            {% load adv_cache_test %}
-            {% cache_set_fail 1 test_cached_template obj.pk obj.updated_at %}
+            {% load adv_cache %}
+            {% cache 1 undefined_fragment_name obj.pk obj.updated_at %}
                 {{ obj.get_name }}
-            {% endcache_set_fail %}
+            {% endcache %}
         """
 
-        # Render a first time, should still be rendered
-        self.assertStripEqual(self.render(t), expected)
-
-        # Now the rendered template should NOT be in cache
-        key = self.get_template_key('test_cached_template',
-                                    vary_on=[self.obj['pk'], self.obj['updated_at']],
-                                    prefix='template.cache_set_fail')
-        self.assertEqual(
-            key, 'template.cache_set_fail.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
-
-        # But not in the ``default`` cache
-        self.assertIsNone(get_cache('default').get(key))
-
-        # It should raise if templates debug mode is activated
-        with self.set_template_debug_true():
-            with self.assertRaises(ValueError) as raise_context:
-                self.render(t)
-            self.assertIn('boom set', str(raise_context.exception))
-
-    def test_failure_when_getting_cache(self):
-        """Test that the template is correctly rendered even if the cache cannot be read."""
+        with self.assertRaises(template.VariableDoesNotExist) as raise_context:
+            self.render(t, {'fragment_name': 'test_cached_template'})
+        self.assertIn('undefined_fragment_name', str(raise_context.exception))
 
-        expected = "foobar"
+    def test_passing_fragment_name_as_string(self):
+        """Test passing the fragment name as a variable."""
 
         t = """
-            {% load adv_cache_test %}
-            {% cache_get_fail 1 test_cached_template obj.pk obj.updated_at %}
+            {% load adv_cache %}
+            {% cache 1 "test_cached_template" obj.pk obj.updated_at %}
                 {{ obj.get_name }}
-            {% endcache_get_fail %}
+            {% endcache %}
         """
 
-        # Render a first time, should still be rendered
-        self.assertStripEqual(self.render(t), expected)
-
-        # Now the rendered template should be in cache
         key = self.get_template_key('test_cached_template',
-                                    vary_on=[self.obj['pk'], self.obj['updated_at']],
-                                    prefix='template.cache_get_fail')
+                                    vary_on=[self.obj['pk'], self.obj['updated_at']])
         self.assertEqual(
-            key, 'template.cache_get_fail.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
-
-        # It should be in the cache
-        cache_expected = b"1::\n                foobar"
-        self.assertStripEqual(get_cache('default').get(key), cache_expected)
+            key, 'template.cache.test_cached_template.0cac9a03d5330dd78ddc9a0c16f01403')
 
-        # It should raise if templates debug mode is activated
-        with self.set_template_debug_true():
-            with self.assertRaises(ValueError) as raise_context:
-                self.render(t)
-            self.assertIn('boom get', str(raise_context.exception))
+        self.check_cache_flow(t, key, self.DEFAULT_CACHE_EXPECTED)